@@ -14,15 +14,23 @@ The script performs the following steps:
 
 import tableauserverclient as TSC
 import datetime
+import functools
 import requests
+from requests.adapters import HTTPAdapter
 import os
 import argparse
-import json
 import uuid
+import shutil
+from io import BytesIO
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from pptx import Presentation
 from pptx.util import Inches
 from PIL import Image
-from fpdf import FPDF
+from fpdf import FPDF, FPDF_VERSION
+import img2pdf
+from pypdf import PdfWriter
+import tableau_cache
 
 # update for new requirements
 from PIL import Image
@@ -38,6 +46,10 @@ api_version = '3.22'
 ppt_location = ''
 img_export = "img/"
 img_indexing = []
+export_workers = 8  # Number of views exported concurrently
+download_chunk_size = 1 << 20  # 1 MB
+http_pool_size = 32  # Keep-alive connections kept open to the server, at least export_workers
+tile_jpeg_quality = 85
 
 
 def connect_tableau():
@@ -47,6 +59,9 @@ def connect_tableau():
                                                    personal_access_token=access_token,
                                                    site_id=site_name)
         server = TSC.Server(server_url)
+        # TSC and the view downloads share this session, so the TLS connections are reused by all requests
+        adapter = HTTPAdapter(pool_connections=http_pool_size, pool_maxsize=http_pool_size)
+        server.session.mount("https://", adapter)
         server.auth.sign_in(tableau_auth)
         print("DEBUG: Connected to Tableau Server")
         return server
@@ -54,13 +69,14 @@ def connect_tableau():
         print("ERR: Error connecting to Tableau Server")
         raise err
 
-def get_workbook(server, workbook_name, project_name):
+def get_workbook(server, workbook_name, project_name, use_cache=False):
     """ Retrieves the workbook ID based on the given workbook name and project name.
 
     Args:
         server (TableauServer): The Tableau Server object.
         workbook_name (str): The name of the workbook to search for.
         project_name (str): The name of the project where the workbook resides.
+        use_cache (bool): Reuse the workbook ID cached by a recent run.
 
     Returns:
         int: The ID of the matching workbook.
@@ -69,10 +85,21 @@ def get_workbook(server, workbook_name, project_name):
         FileExistsError: If no workbook with the specified name is found or if multiple workbooks
                         share the same name.
     """
-    # Get all workbooks in the specified project
-    all_workbooks = list(TSC.Pager(server.workbooks))
-    matching_workbooks = [workbook for workbook in all_workbooks if
-                          workbook.name == workbook_name and workbook.project_name == project_name]
+    cache_key = f"{project_name}/{workbook_name}"
+    cached_workbooks = tableau_cache.read_cache(site_name, api_version, "workbooks") or {}
+    if use_cache and cache_key in cached_workbooks:
+        workbook = TSC.WorkbookItem(project_id=None, name=workbook_name)
+        return tableau_cache.restore_item(workbook, cached_workbooks[cache_key])
+
+    # Let the server filter the workbooks by name and project instead of listing the whole site
+    req_option = TSC.RequestOptions()
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Name,
+                                     TSC.RequestOptions.Operator.Equals,
+                                     workbook_name))
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.ProjectName,
+                                     TSC.RequestOptions.Operator.Equals,
+                                     project_name))
+    matching_workbooks, _ = server.workbooks.get(req_option)
     if len(matching_workbooks) == 0:
         error = f"Workbook '{workbook_name}' not found in project '{project_name}'."
         raise FileExistsError(error)
@@ -80,6 +107,8 @@ def get_workbook(server, workbook_name, project_name):
         error = f"Multiple workbooks with name '{workbook_name}' found in project '{project_name}'."
         raise FileExistsError(error)
 
+    cached_workbooks[cache_key] = matching_workbooks[0].id
+    tableau_cache.write_cache(site_name, api_version, "workbooks", cached_workbooks)
     return matching_workbooks[0]
 
 
@@ -93,9 +122,7 @@ def load_config(config_file):
         dict: The configuration settings.
     """
     try:
-        with open(config_file, "r") as file:
-            config = json.load(file)
-            return config
+        return tableau_cache.load_json(config_file)
     except Exception as err:
         print(f"ERR: Error loading configuration file '{config_file}'.")
         raise err
@@ -125,35 +152,88 @@ def get_image_export(filters) -> TSC.ImageRequestOptions:
     return image_export
 
 
-def export_images(server, workbook, image_export_option, img_dir, ppt_slides):
-    """ Export the images for each view in the workbook.
+def download_view_content(server, view, content_type, request_option, file):
+    """ Stream the image or data of a view from the REST API straight into a file.
+
+    Args:
+        server (TableauServer): The Tableau Server object.
+        view (TableauView): The view to download.
+        content_type (str): The view endpoint to download, 'image' or 'data' (CSV).
+        request_option (TSC.RequestOptionsBase): The options and filters applied to the view.
+        file (BinaryIO): The file or buffer to write the content to.
+    """
+    url = f"{server.views.baseurl}/{view.id}/{content_type}"
+    headers = {"X-Tableau-Auth": server.auth_token}
+    with server.session.get(url, params=request_option.get_query_params(), headers=headers,
+                            stream=True) as response:
+        response.raise_for_status()
+        # Let urllib3 undo any transfer compression while copying the raw stream
+        response.raw.decode_content = True
+        shutil.copyfileobj(response.raw, file, length=download_chunk_size)
+
+
+def export_view(server, view, image_export_option, img_dir, slide_dir):
+    """ Export the slide tiles and the CSV data for a single view.
+
+    Args:
+        server (TableauServer): The Tableau Server object.
+        view (TableauView): The view to export.
+        image_export_option (TSC.ImageRequestOptions): The image export options.
+        img_dir (str): The directory to save the CSV data to.
+        slide_dir (str): The directory to save the slide tiles to.
+
+    Returns:
+        list: The names of the slide tile files of the view.
+    """
+    view_name = view.name
+    print(f"DEBUG: Exporting image for view '{view_name}'")
+    # The view image is only needed to cut the slide tiles, so it is split in memory
+    image_buffer = BytesIO()
+    download_view_content(server, view, "image", image_export_option, image_buffer)
+    image_buffer.seek(0)
+    tile_files = split_image(image_buffer, slide_dir, 2, 2, view_name)
+    print(f"DEBUG: Image for view '{view_name}' split into {len(tile_files)} slide tiles")
+
+    #csv_path = file_path1 + view.name + '.csv'
+    csv_path = os.path.join(img_dir, f"{view_name}.csv")
+    with open(csv_path, "wb") as csv_file:
+        download_view_content(server, view, "data", image_export_option, csv_file)
+    return tile_files
+
+
+def export_images(server, workbook, image_export_option, img_dir, slide_dir, ppt_slides):
+    """ Export the images for each view in the workbook, split into tiles for the respective slides.
+
+    The views are exported concurrently since each export is a blocking round-trip to the server.
 
     Args:
         server (TableauServer): The Tableau Server object.
         workbook (TableauWorkbook): The workbook to export.
         image_export_option (TSC.ImageRequestOptions): The image export options.
-        img_dir (str): The directory to save the images to.
+        img_dir (str): The directory to save the CSV data to.
+        slide_dir (str): The directory to save the slide tiles to.
+    """
+    # Skip the views that are not in the list of slides to export
+    views = [view for view in workbook.views if view.name in ppt_slides]
+    with ThreadPoolExecutor(max_workers=export_workers) as executor:
+        # map() keeps the results in the workbook order of the views
+        for tile_files in executor.map(
+                lambda view: export_view(server, view, image_export_option, img_dir, slide_dir), views):
+            img_indexing.extend(tile_files)
+
+
+def get_image_size(img_source):
+    """ Get the dimensions of an image without decoding its pixels.
+
+    Args:
+        img_source (str | BytesIO): The path to the image file or a buffer holding the image.
+
+    Returns:
+        tuple: The width and height of the image.
     """
-    for view in workbook.views:
-        view_name = view.name
-        # Skip the views that are not in the list of slides to export
-        if view_name not in ppt_slides:
-            continue
-        print(f"DEBUG: Exporting image for view '{view_name}'")
-        server.views.populate_image(view, image_export_option)
-        image = view.image
-        image_path = os.path.join(img_dir, f"{view_name}.png")
-        img_indexing.append(f"{view_name}.png")
-        with open(image_path, "wb") as file:
-            file.write(image)
-        print(f"DEBUG: Image exported to '{image_path}'")
-
-        server.views.populate_csv(view, image_export_option)
-        #csv_path = file_path1 + view.name + '.csv'
-        csv_path = os.path.join(img_dir, f"{view_name}.csv")
-        with open(csv_path, 'wb') as csv_file:
-            # Perform byte join on the CSV data
-            csv_file.write(b''.join(view.csv))
+    # PIL only parses the image header here, the context manager releases the file handle
+    with Image.open(img_source) as img:
+        return img.size
 
 
 def get_images(img_dir):
@@ -188,6 +268,30 @@ def add_title_slide(prs, workbook_name, project_name):
     subtitle.text = f"Project: {project_name}\nExported on: {datetime.datetime.now()}"
     
 
+@functools.lru_cache(maxsize=None)
+def get_picture_layout(slide_width, slide_height, img_width, img_height):
+    """ Get the size and the centered position of an image scaled to fit within the slide.
+
+    The slide tiles mostly share the same dimensions, so the layout is computed once per image size.
+
+    Args:
+        slide_width (int): The width of the slide in EMU.
+        slide_height (int): The height of the slide in EMU.
+        img_width (int): The width of the image in pixels.
+        img_height (int): The height of the image in pixels.
+
+    Returns:
+        tuple: The left, top, width and height of the picture in EMU.
+    """
+    # Calculate the scaling factor to fit the image within the slide
+    max_width = Inches(8)
+    max_height = Inches(6)
+    scale = min(max_width / img_width, max_height / img_height)
+    width, height = img_width * scale, img_height * scale
+    # Calculate the centered position
+    return (slide_width - width) / 2, (slide_height - height) / 2, width, height
+
+
 def add_image_to_ppt(prs, img_dir, img_file):
     """ Add an image to the PowerPoint presentation.
 
@@ -207,22 +311,13 @@ def add_image_to_ppt(prs, img_dir, img_file):
 
     # Load the image
     img_path = os.path.join(img_dir, img_file)
-    img = Image.open(img_path)
-    img_width, img_height = img.size
-
-    # Calculate the scaling factor to fit the image within the slide
-    max_width = Inches(8)
-    max_height = Inches(6)
-    width_scale = max_width / img_width
-    height_scale = max_height / img_height
-    scale = min(width_scale, height_scale)
+    img_width, img_height = get_image_size(img_path)
 
-    # Calculate the centered position
-    left = (slide_width - img_width * scale) / 2
-    top = (slide_height - img_height * scale) / 2
+    # Calculate the size and the centered position of the image within the slide
+    left, top, width, height = get_picture_layout(slide_width, slide_height, img_width, img_height)
 
     # Add the image to the slide
-    slide.shapes.add_picture(img_path, left, top, width=img_width * scale, height=img_height * scale)
+    slide.shapes.add_picture(img_path, left, top, width=width, height=height)
     print(f"DEBUG: Added image '{img_file}' to the PowerPoint presentation")
 
 
@@ -298,42 +393,12 @@ def add_title_page(pdf, pdf_config):
     # pdf.cell(200, 10, f"Exported on: {datetime.datetime.now()}", ln=True, align="C")
 
 
-def add_image_to_pdf(pdf, img_path, pdf_config):
-    """ Add an image to the PDF deck.
-
-    Args:
-        pdf (FPDF): The PDF object to add the image to.
-        img_path (str): The path to the image file.
-        pdf_config (dict): The configuration settings for the PDF export.
-    """
-    img = Image.open(img_path)
-    img_width, img_height = img.size
-    # Calculate the image dimensions to fit within the page
-    page_width, page_height = pdf.w, pdf.h
-    if img_width > page_width or img_height > page_height:
-        ratio_width = page_width / img_width
-        ratio_height = page_height / img_height
-        if ratio_width < ratio_height:
-            new_width = page_width
-            new_height = img_height * ratio_width
-        else:
-            new_width = img_width * ratio_height
-            new_height = page_height
-    else:
-        new_width = img_width
-        new_height = img_height
-
-    # Calculate the x and y coordinates to place the image at the center of the page
-    x = (page_width - new_width) / 2
-    y = (page_height - new_height) / 2
-    
-    pdf.add_page()
-    pdf.image(img_path, x=x, y=y, w=new_width, h=new_height)
-
-
 def export_as_pdf(img_dir, output_path, pdf_config):
     """ Create a PDF deck from the exported images.
 
+    The title page is drawn with FPDF, the image pages are written by img2pdf which embeds the
+    JPEG tiles as they are instead of re-encoding them.
+
     Args:
         img_dir (str): The directory containing the exported images.
         output_path (str): The path to save the PPT deck to.
@@ -343,34 +408,51 @@ def export_as_pdf(img_dir, output_path, pdf_config):
     print("DEBUG: Creating PDF deck")
     pdf = FPDF(orientation=pdf_config["orientation"], unit="mm", format=pdf_config["page_type"])
     pdf.set_auto_page_break(auto=True, margin=15)
-    # Step 2: Add the images to the PDF deck
+    # Step 2: Add the title page to the PDF deck
     add_title_page(pdf, pdf_config)
     # Step 3.1: Get the list of exported images  
     img_files = get_images(img_dir)
-    # Step 3.2: Add each image to the PDF deck
-    for img_file in img_files:
-        img_path = os.path.join(img_dir, img_file)
-        add_image_to_pdf(pdf, img_path, pdf_config)      
+    img_paths = [os.path.join(img_dir, img_file) for img_file in img_files]
+    # Step 3.2: Add each image centered on a page of the title page size, scaled to fill the page
+    deck = PdfWriter()
+    if FPDF_VERSION.startswith("1."):
+        # PyFPDF (1.x) returns the document as a latin-1 str
+        title_page = pdf.output(dest="S").encode("latin-1")
+    else:
+        # fpdf2 returns a bytearray, its dest argument is deprecated
+        title_page = pdf.output()
+    deck.append(BytesIO(bytes(title_page)))
+    if img_paths:
+        page_size = (img2pdf.mm_to_pt(pdf.w), img2pdf.mm_to_pt(pdf.h))
+        layout = img2pdf.get_layout_fun(pagesize=page_size, fit=img2pdf.FitMode.into)
+        deck.append(BytesIO(img2pdf.convert(img_paths, layout_fun=layout)))
     # Step 4: Save the PDF deck to the specified location
-    pdf.output(output_path)    
+    deck.write(output_path)
 
 
-def split_image(image_path, output_dir, rows, cols, img_name, tmp_index):
+def split_image(image_source, output_dir, rows, cols, img_name):
     """
     Split the image into tiles and save them to the output directory
 
     Args:
-        image_path (str): The path to the image file to split.
+        image_source (str | BytesIO): The path to the image file or a buffer holding the image to split.
         output_dir (str): The directory to save the tiles to.
         rows (int): The number of rows to split the image into.
         cols (int): The number of columns to split the image into.
+        img_name (str): The name used as prefix for the tile files.
+
+    Returns:
+        list: The names of the tile files, in slide order.
     """
-    img = Image.open(image_path)
-    width, height = img.size
+    # Decode the image once, the tiles are sliced as views of the same pixel array
+    with Image.open(image_source) as img:
+        pixels = np.asarray(img.convert("RGB"))
+    height, width = pixels.shape[:2]
     
     tile_width = width // cols
     tile_height = height // rows
     
+    tile_files = []
     os.makedirs(output_dir, exist_ok=True)
     for row in range(rows):
         for col in range(cols):
@@ -387,32 +469,13 @@ def split_image(image_path, output_dir, rows, cols, img_name, tmp_index):
                 right = left + tile_width
                 lower = upper + tile_height
                 
-            tile = img.crop((left, upper, right, lower))
-            export_name = f"{img_name}_tile_{row}_{col}.png" 
+            tile = Image.fromarray(pixels[upper:lower, left:right])
+            export_name = f"{img_name}_tile_{row}_{col}.jpg" 
             tile_path = os.path.join(output_dir, export_name)
-            tile.save(tile_path)
-            tmp_index.append(export_name)
+            tile.save(tile_path, format="JPEG", quality=tile_jpeg_quality)
+            tile_files.append(export_name)
             # print(f"Saved {tile_path}")
-
-
-def generate_slide_imgs(img_dir):
-    """ Split the images into tiles for respective slides.
-
-    Args:
-        img_dir (str): The directory containing the exported images.
-        img_indexing (list): The list of image files in the directory.
-    """
-    global img_indexing
-    tmp_index = []
-    for img_file in img_indexing:
-        img_path = os.path.join(img_dir, img_file)
-        export_dir = os.path.join(img_dir, "slide_imgs")
-        img_name = img_file.split(".")[0]
-        split_image(img_path, export_dir, 2, 2, img_name, tmp_index)             
-    print(f"DEBUG: Split images into tiles for respective slides")
-    img_indexing = tmp_index # Update the image indexing list
-    return os.path.join(img_dir, "slide_imgs") # Update the image directory
-    # print(f"DEBUG: Updated image indexing list: {img_indexing}")
+    return tile_files
 
 
 if __name__ == "__main__":
@@ -424,6 +487,8 @@ if __name__ == "__main__":
     # Config for pdf  e.g. page_type, orientation
     parser.add_argument("--page_type", default="A4", help="The page type for the PDF (e.g., 'A4').")
     parser.add_argument("--orientation", default="landscape", help="The orientation for the PDF (e.g., 'landscape').")
+    # Opt-in only: a deleted and republished workbook keeps its old cached ID until the cache expires
+    parser.add_argument("--cache", action="store_true", help="Reuse the workbook ID cached by a run in the last 10 minutes.")
     
     args = parser.parse_args()
     config_file = "config/"+args.config_file
@@ -443,13 +508,14 @@ if __name__ == "__main__":
     config = load_config(config_file)
     workbook_name = config["workbook_name"]
     project_name = config["project_name"]
-    ppt_slides = config["slide_views"]
+    # dict keys give O(1) membership tests and drop duplicate slide entries
+    ppt_slides = dict.fromkeys(config["slide_views"])
 
 
     print("----------------------------------------STEP#1------------------------------------------------")
     print(f"DEBUG: Configuration loaded:\n- Workbook: {workbook_name}\n- Project: {project_name}")
     # STEP 3: Get the workbook luid to be exported
-    workbook = get_workbook(server, workbook_name, project_name)
+    workbook = get_workbook(server, workbook_name, project_name, use_cache=args.cache)
     # STEP 3.1: Populate the views in the workbook
     server.workbooks.populate_views(workbook)
     # print("DEBUG: Workbook views populated")
@@ -462,13 +528,14 @@ if __name__ == "__main__":
     # STEP 5.1: Create the directory with a unique id
     export_id = str(uuid.uuid4())
     img_dir = os.path.join(img_export, export_id)
+    root_img_dir = img_dir  # img_dir moves to the slide images sub-directory in STEP 5.2
     os.makedirs(img_dir, exist_ok=True)
     print(f"DEBUG: Image directory created: {img_dir}")
     
-    # STEP 5.2: Export the images for each view
-    export_images(server, workbook, image_export_option, img_dir, ppt_slides)
-    # STEP 5.3: Split the images for respective slides
-    img_dir = generate_slide_imgs(img_dir)
+    # STEP 5.2: Export the images for each view, split into tiles for respective slides
+    slide_dir = os.path.join(img_dir, "slide_imgs")
+    export_images(server, workbook, image_export_option, img_dir, slide_dir, ppt_slides)
+    img_dir = slide_dir # Update the image directory
     print("----------------------------------------STEP#2------------------------------------------------")
 
     # quit()
@@ -495,10 +562,7 @@ if __name__ == "__main__":
 
     # STEP 7: Clean up the image directory
     print("DEBUG: Cleaning up the image directory")
-    for file in os.listdir(img_dir):
-        file_path = os.path.join(img_dir, file)
-        os.remove(file_path)
-    os.rmdir(img_dir)
+    shutil.rmtree(root_img_dir, ignore_errors=True)
     print("DEBUG: Image directory cleaned up.")
 
     # STEP 8: Sign out from the Tableau Server
@@ -14,6 +14,10 @@ Steps:
 '''
 
 import tableauserverclient as TSC
+import aiohttp
+import argparse
+import asyncio
+import tableau_cache
 
 # Configurtion
 server_url = 'https://prod-useast-b.online.tableau.com/'
@@ -26,6 +30,8 @@ api_version = '3.22'
 ppt_location = ''
 img_export = "img/"
 img_indexing = []
+populate_connections = 16  # Number of concurrent requests to populate the projects
+populate_timeout = 60  # seconds, per permissions request
 
 
 def connect_tableau():
@@ -42,33 +48,51 @@ def connect_tableau():
         print("ERR: Error connecting to Tableau Server")
         raise err
 
-def get_projects(server: TSC.Server) -> dict:
+def get_projects(server: TSC.Server, use_cache=False) -> dict:
     '''
     Get all the projects on the server
     
     Args:
     server: Tableau Server connection object
+    use_cache: Reuse the project listing cached by a recent run
     '''
+    if use_cache:
+        cached_projects = tableau_cache.read_cache(site_name, api_version, 'projects')
+        if cached_projects is not None:
+            return {project_id: tableau_cache.restore_item(TSC.ProjectItem(name), project_id)
+                    for project_id, name in cached_projects.items()}
+
     # Step 3: Get all the projects
     all_projects, pagination_item = server.projects.get()
     projects = {}
     for project in all_projects:
         projects[project.id] = project
+    tableau_cache.write_cache(site_name, api_version, 'projects',
+                              {project.id: project.name for project in all_projects})
     return projects
 
 
-def get_all_groups(server: TSC.Server) -> dict:
+def get_all_groups(server: TSC.Server, use_cache=False) -> dict:
     '''
     Get all the groups on the server
 
     Args:
     server: Tableau Server connection object
+    use_cache: Reuse the group listing cached by a recent run
     '''
+    if use_cache:
+        cached_groups = tableau_cache.read_cache(site_name, api_version, 'groups')
+        if cached_groups is not None:
+            return {group_id: tableau_cache.restore_item(TSC.GroupItem(name), group_id)
+                    for group_id, name in cached_groups.items()}
+
     all_groups, pagination_item = server.groups.get()
     # print("There are {} groups on site: ".format(pagination_item.total_available))    
     groups = {}
     for group in all_groups:
         groups[group.id] = group
+    tableau_cache.write_cache(site_name, api_version, 'groups',
+                              {group.id: group.name for group in all_groups})
     return groups
 
 
@@ -80,8 +104,8 @@ def check_prod_group(group):
     group: Group object
     '''
     is_prod = False
-    # Local condition: Check if the group name starts with 'prod'
-    if group.name.lower().startswith('prod'):
+    # Local condition: Check if the group name starts with 'prod' (only the prefix is lower-cased)
+    if group.name[:4].lower() == 'prod':
         is_prod = True
     return is_prod
 
@@ -104,19 +128,34 @@ def get_prod_permissions(project, groups):
     return prod_permissions
 
 
-def get_dev_group(group, group_index):
+def get_group_name_index(groups):
+    '''
+    Index the groups by their lower-cased name
+
+    Args:
+    groups: All the groups on the server
+    '''
+    return {group.name.lower(): group for group in groups.values()}
+
+
+def get_dev_group(group, group_name_index):
+    '''
+    Get the dev group matching the production group
+
+    Args:
+    group: Group object
+    group_name_index: All the groups on the server, keyed by lower-cased name
+    '''
     group_name = group.name.lower()
     
     # TODO: Chnage with original logic
     if group_name.startswith('prod'):
-        group_name = group_name.replace('prod', 'dev')
+        # Swap the prefix only, a 'prod' further in the name is part of the group name
+        group_name = group_name.replace('prod', 'dev', 1)
     
     # Check if the group already exists
-    for group in group_index.values():
-        if group.name.lower() == group_name:
-            return group
     # TODO: If the group does not exist, create it
-    return None
+    return group_name_index.get(group_name)
 
 
 def get_default_permission(project, group_id, permission_type='workbook'):
@@ -174,7 +213,7 @@ def apply_permissions(server, project, dev_group, permission):
     print(" Done")
 
 
-def replicate_dev_permissions(server, project, valid_permisssions, groups):
+def replicate_dev_permissions(server, project, valid_permisssions, groups, group_name_index):
     '''
     Replicate the permissions from one project to another
     
@@ -183,6 +222,7 @@ def replicate_dev_permissions(server, project, valid_permisssions, groups):
     project: Project object
     valid_permisssions: List of valid permissions
     groups: All the groups on the server
+    group_name_index: All the groups on the server, keyed by lower-cased name
     '''
     print("\t- Processing: ...Replicating permissions")
     for permission in valid_permisssions:
@@ -190,7 +230,7 @@ def replicate_dev_permissions(server, project, valid_permisssions, groups):
             # Step 1: Get the group for replication
             group_name = groups[permission.grantee.id].name
             print(f'\t- Checking for the dev group for group {group_name}...', end='')
-            dev_group = get_dev_group(groups[permission.grantee.id], groups)
+            dev_group = get_dev_group(groups[permission.grantee.id], group_name_index)
             if not dev_group:
                 print(" ERR: Dev group not found for group {}".format(permission.grantee.id))
                 continue
@@ -203,6 +243,60 @@ def replicate_dev_permissions(server, project, valid_permisssions, groups):
             raise err
 
 
+async def fetch_permissions(session, server, url):
+    '''
+    Fetch and parse the permission rules returned by a permissions endpoint
+
+    Args:
+    session: aiohttp client session
+    server: Tableau Server connection object
+    url: URL of the permissions endpoint
+    '''
+    headers = {'X-Tableau-Auth': server.auth_token}
+    async with session.get(url, headers=headers) as response:
+        response.raise_for_status()
+        content = await response.read()
+    # Parse with TSC so the rules are the same objects its populate_* calls would return
+    return TSC.PermissionsRule.from_response(content, server.namespace)
+
+
+async def populate_project_permissions(session, server, project):
+    '''
+    Populate the project, default workbook and default datasource permissions of the project
+
+    Args:
+    session: aiohttp client session
+    server: Tableau Server connection object
+    project: Project object
+    '''
+    # print("\nProject: {}".format(project.name))
+    project_url = f"{server.baseurl}/sites/{server.site_id}/projects/{project.id}"
+    permissions, workbook_permissions, datasource_permissions = await asyncio.gather(
+        fetch_permissions(session, server, f"{project_url}/permissions"),
+        fetch_permissions(session, server, f"{project_url}/default-permissions/workbooks"),
+        fetch_permissions(session, server, f"{project_url}/default-permissions/datasources"))
+    # Keep the fetched rules on the project, as TSC's populate_* would
+    project._set_permissions(lambda: permissions)
+    project._set_default_permissions(lambda: workbook_permissions, 'workbook')
+    project._set_default_permissions(lambda: datasource_permissions, 'datasource')
+
+
+async def populate_all_projects(server, projects):
+    '''
+    Populate the permissions of all the projects concurrently over a shared connection pool
+
+    Args:
+    server: Tableau Server connection object
+    projects: All the projects on the server
+    '''
+    connector = aiohttp.TCPConnector(limit=populate_connections)
+    timeout = aiohttp.ClientTimeout(total=populate_timeout)
+    # trust_env: use the proxy (HTTPS_PROXY/NO_PROXY) and .netrc settings, like the requests session of TSC
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout, trust_env=True) as session:
+        await asyncio.gather(*[populate_project_permissions(session, server, project)
+                               for project in projects.values()])
+
+
 def init_replicate(server: TSC.Server, all_projects: dict, all_groups: dict):
     '''
     Initialize the replication of permissions from one project to another
@@ -215,13 +309,11 @@ def init_replicate(server: TSC.Server, all_projects: dict, all_groups: dict):
 
     # Step 4: Populate the projects with permissions
     print("Debug. Populating the projects with permissions ...", end="")
-    for project_id, project in all_projects.items():
-        # print("\nProject: {}".format(project.name))
-        server.projects.populate_permissions(project)
-        server.projects.populate_workbook_default_permissions(project)
-        server.projects.populate_datasource_default_permissions(project)
+    asyncio.run(populate_all_projects(server, all_projects))
     print("Done")
 
+    group_name_index = get_group_name_index(all_groups)
+
     print("Debug: Starting the process of replicating permissions from dev to prod")
     for project_id, project in all_projects.items():
         # STEP 1: if Valid project with valid permissions
@@ -231,18 +323,26 @@ def init_replicate(server: TSC.Server, all_projects: dict, all_groups: dict):
         print("-------------------------------------------------------------------------------------------")
         print(f"Debug: {project.name} has {len(valid_permisssions)} valid permissions.")
         # STEP 2: For each permission, run replicate_dev_permissions
-        replicate_dev_permissions(server, project, valid_permisssions, all_groups)   
+        replicate_dev_permissions(server, project, valid_permisssions, all_groups, group_name_index)   
     
 
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Replicate prod group permissions with dev groups.")
+    # Opt-in only: this script changes permissions, and a group created since the cached run
+    # (e.g. a missing dev group) would not be seen until the cache expires
+    parser.add_argument("--cache", action="store_true",
+                        help="Reuse the project and group listings cached by a run in the last 10 minutes.")
+    args = parser.parse_args()
+    use_cache = args.cache
+
     # Step 1: Connect to Tableau Server
     server = connect_tableau()
     server.version = '3.22'
 
     # Step 2: Get all the projects and Groups
-    all_projects, all_groups = get_projects(server), get_all_groups(server)
+    all_projects, all_groups = get_projects(server, use_cache), get_all_groups(server, use_cache)
 
     # Step 3: Initialize the replication
     init_replicate(server, all_projects, all_groups)
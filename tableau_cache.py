@@ -0,0 +1,99 @@
+'''
+Small on-disk cache for the Tableau content listings (id <-> name) used by the automation scripts.
+
+Each listing is stored as a JSON file per site, API version and content type under the cache directory.
+A listing older than the TTL is treated as missing, so it is refreshed on the next run.
+'''
+
+import json
+import os
+import time
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard json module
+    orjson = None
+
+# Configurtion
+cache_dir = ".cache"
+cache_ttl = 10 * 60  # seconds
+
+
+def get_cache_path(site_name, api_version, content_type):
+    '''
+    Get the path of the cache file for a content listing
+
+    Args:
+    site_name: Name of the Tableau site
+    api_version: Version of the REST API
+    content_type: Type of the cached content (e.g. projects, groups, workbooks)
+    '''
+    return os.path.join(cache_dir, f"{site_name}_{api_version}_{content_type}.json")
+
+
+def load_json(path):
+    '''
+    Load a JSON file, parsed with orjson when it is installed
+
+    Args:
+    path: Path of the JSON file
+    '''
+    with open(path, "rb") as file:
+        if orjson:
+            return orjson.loads(file.read())
+        return json.load(file)
+
+
+def read_cache(site_name, api_version, content_type):
+    '''
+    Read a content listing from the cache
+
+    Args:
+    site_name: Name of the Tableau site
+    api_version: Version of the REST API
+    content_type: Type of the cached content (e.g. projects, groups, workbooks)
+
+    Returns:
+    The cached listing, or None if it is missing or expired
+    '''
+    cache_path = get_cache_path(site_name, api_version, content_type)
+    try:
+        if time.time() - os.path.getmtime(cache_path) > cache_ttl:
+            return None
+        return load_json(cache_path)
+    except (OSError, ValueError):
+        return None
+
+
+def write_cache(site_name, api_version, content_type, listing):
+    '''
+    Write a content listing to the cache
+
+    Args:
+    site_name: Name of the Tableau site
+    api_version: Version of the REST API
+    content_type: Type of the cached content (e.g. projects, groups, workbooks)
+    listing: JSON serializable listing to cache
+    '''
+    cache_path = get_cache_path(site_name, api_version, content_type)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first so a concurrent run never reads a partial listing
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        if orjson:
+            file.write(orjson.dumps(listing))
+        else:
+            file.write(json.dumps(listing).encode())
+    os.replace(tmp_path, cache_path)
+
+
+def restore_item(item, item_id):
+    '''
+    Set the id of an item rebuilt from the cache, TSC only sets it from server responses
+
+    Args:
+    item: TSC item (e.g. ProjectItem, GroupItem, WorkbookItem)
+    item_id: Id of the item on the server
+    '''
+    item._id = item_id
+    return item
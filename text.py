@@ -1,10 +1,18 @@
 import config.server_cfg as config
 import tableauserverclient as TSC
-from datetime import datetime, timezone
-import pandas as pd
+from datetime import datetime, timedelta, timezone
+import csv
+import logging
+import sys
 
 # Global variables
+API_VERSION = '3.22'  # The bulk user import needs REST API 3.15 or later
 INACTIVE_THRESHOLD = 500  # days
+# Tableau Cloud does not support switching sites and scopes a personal access token to one site
+IS_TABLEAU_CLOUD = "online.tableau.com" in config.HYPER_SITE_URL
+PAGE_SIZE = 1000  # Items per REST API page (server maximum), the default of 100 costs 10x the round-trips
+
+logger = logging.getLogger(__name__)
 
 
 def tableau_signin(site_id):
@@ -15,144 +23,217 @@ def tableau_signin(site_id):
         site_id=site_id
     )
     server = TSC.Server(config.HYPER_SITE_URL, use_server_version=False)
+    server.version = API_VERSION
     # server.add_http_options({'verify': False})
     server.auth.sign_in(tableau_auth)
     return server
 
+def tableau_signout(server):
+    '''Sign out of Tableau server, a failed sign out (e.g. 401 on an ended session) is only reported'''
+    try:
+        server.auth.sign_out()
+        print("INFO: Successfully signed out of Tableau server.")
+    except Exception as e:
+        print(f"WARNING: Failed to sign out of Tableau server - {e}")
+
 def get_users(server):
-    '''Get all the users from the Tableau server'''
-    all_users, pagination_item = server.users.get()
-    print("INFO: Total number of users: ", pagination_item.total_available)
-    return all_users
+    '''Get the viewers whose last sign in is older than the inactive threshold from the Tableau server'''
+    # Let the server filter the users instead of listing all of them
+    cutoff = datetime.now(timezone.utc) - timedelta(days=INACTIVE_THRESHOLD + 1)
+    req_option = TSC.RequestOptions(pagesize=PAGE_SIZE)
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.SiteRole,
+                                     TSC.RequestOptions.Operator.Equals,
+                                     "Viewer"))
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.LastLogin,
+                                     TSC.RequestOptions.Operator.LessThanOrEqual,
+                                     cutoff.strftime("%Y-%m-%dT%H:%M:%SZ")))
+    # The pager fetches the pages lazily while the users are iterated
+    return TSC.Pager(server.users, req_option)
 
 def get_sites(server):
     '''Get all the sites from the Tableau server'''
     sites_list =[]
-    all_sites, pagination_item = server.sites.get()
-    for site in all_sites:
-        sites_list.append(site.content_url)
-    print("INFO: Total number of sites: ", pagination_item.total_available)
-    server.auth.sign_out()
+    # server.sites.get() only returns the first page, the pager walks all of them
+    for site in TSC.Pager(server.sites, TSC.RequestOptions(pagesize=PAGE_SIZE)):
+        sites_list.append(site)
+    print("INFO: Total number of sites: ", len(sites_list))
     return sites_list
 
-def get_inactive_users(viewer_list):
+def get_inactive_users(user_list, site_url):
     '''Identify viewers whose last sign in > 500 days : Inactive users'''
     inactive_users = []
-    for user in viewer_list:
-        if user.last_login is not None:
-            now = datetime.now(timezone.utc)
-            days_inactive = (now - user.last_login).days
-            if days_inactive > INACTIVE_THRESHOLD:
-                inactive_users.append(user)
-                print("Inactive user: ", user.name, " Last login: ", user.last_login, " Days inactive: ", days_inactive)
-    print("INFO: Total number of inactive users: ", len(inactive_users))
+    # One reference time for the whole scan, compared as a POSIX timestamp
+    cutoff_ts = (datetime.now(timezone.utc) - timedelta(days=INACTIVE_THRESHOLD + 1)).timestamp()
+    # Single pass over the users: only the viewers with a last sign in are checked
+    for user in user_list:
+        if user.site_role != "Viewer" or user.last_login is None:
+            continue
+        if user.last_login.timestamp() <= cutoff_ts:
+            inactive_users.append(user)
+            # Lazy %s formatting: skipped entirely unless DEBUG logging is enabled
+            logger.debug("Site '%s': Inactive user: %s Last login: %s", site_url, user.name, user.last_login)
+    logger.info("Site '%s': Total number of inactive users: %d", site_url, len(inactive_users))
     return inactive_users
 
 
-def save_info(inactive_users):
+def save_info(inactive_users, csv_filename="users_info.csv"):
     '''Save the inactive user info to a csv file'''
-    parsed_users_info = []
-    for user in inactive_users:
-        user_info = {
-            "ID": user.id,
-            "Name": user.name,
-            "Role": user.site_role,
-            "Last Login": user.last_login,
-            "Email": user.email,
-            "Full Name": user.fullname
-        }
-        parsed_users_info.append(user_info)
-    df = pd.DataFrame(parsed_users_info)
-    csv_filename = "users_info.csv"
-    df.to_csv(csv_filename, index=False)
+    header = ["ID", "Name", "Role", "Last Login", "Email", "Full Name"]
+    with open(csv_filename, "w", newline="") as csv_file:
+        # Rows are written as they are built, no intermediate table is held in memory
+        writer = csv.writer(csv_file)
+        writer.writerow(header)
+        writer.writerows((user.id, user.name, user.site_role, user.last_login, user.email, user.fullname)
+                         for user in inactive_users)
     print(f"User information saved to {csv_filename}")
 
 
-def deactivate_users(inactive_users, server):
+def get_unlicensed_user_ids(server):
+    '''Get the ids of the unlicensed users from the Tableau server'''
+    req_option = TSC.RequestOptions(pagesize=PAGE_SIZE)
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.SiteRole,
+                                     TSC.RequestOptions.Operator.Equals,
+                                     "Unlicensed"))
+    return {user.id for user in TSC.Pager(server.users, req_option)}
+
+
+def deactivate_users(inactive_users, server, site_url):
     '''Deactivate the inactive users'''
     if len(inactive_users) == 0:
-        print("INFO: No inactive users to deactivate.")
+        logger.info("Site '%s': No inactive users to deactivate.", site_url)
         return
     for user in inactive_users:
-        print(f"INFO: Deactivating user: {user.name} ...", end="")
         user.site_role = "Unlicensed"
-        server.users.update(user)
-        print("\tdone!")
-    print("INFO: Deactivation of users completed.")
-
-
-def disable_minimum_site_role(server):
+    # A single CSV import job updates the site role of all the users, instead of one request per user
+    job = server.users.bulk_add(inactive_users)
+    job = server.jobs.wait_for_job(job)
+    # The job can succeed and still reject rows, those are only reported in its notes
+    for note in job.notes or []:
+        logger.warning("Site '%s': User import: %s", site_url, note)
+    # Check the site roles on the server instead of trusting the job
+    unlicensed_user_ids = get_unlicensed_user_ids(server)
+    for user in inactive_users:
+        if user.id not in unlicensed_user_ids:
+            # Not changed by the import: update the user individually
+            try:
+                server.users.update(user)
+            except TSC.ServerResponseError as e:
+                logger.error("Site '%s': Failed to deactivate user: %s - %s", site_url, user.name, e)
+                continue
+        logger.info("Site '%s': Deactivated user: %s", site_url, user.name)
+    logger.info("Site '%s': Deactivation of users completed.", site_url)
+
+
+def get_all_users_group(server):
+    '''Get the "All Users" group of the site'''
+    # Let the server filter the groups by name instead of paging through all of them
+    req_option = TSC.RequestOptions()
+    req_option.filter.add(TSC.Filter(TSC.RequestOptions.Field.Name,
+                                     TSC.RequestOptions.Operator.Equals,
+                                     "All Users"))
+    matching_groups, _ = server.groups.get(req_option)
+    return next(iter(matching_groups), None)
+
+
+def disable_minimum_site_role(server, group):
     '''Disable the minimum site role for all user groups'''
-    all_groups, pagination_item = server.groups.get()
-    for group in all_groups:
-        if group.name == "All Users":
-            print(f"INFO: Disabling minimum site role for group: {group.name}")
-            group.minimum_site_role = None
-            server.groups.update(group)
+    if group is None:
+        return
+    print(f"INFO: Disabling minimum site role for group: {group.name}")
+    group.minimum_site_role = None
+    server.groups.update(group)
 
 
-def enable_minimum_site_role(server):
+def enable_minimum_site_role(server, group):
     '''Enable the minimum site role for all user groups'''
-    all_groups, pagination_item = server.groups.get()
-    for group in all_groups:
-        if group.name == "All Users":
-            print(f"INFO: Enabling minimum site role for group: {group.name}")
-            group.minimum_site_role = 'Viewer'  # Adjust this to the desired role
-            server.groups.update(group)
-
+    if group is None:
+        return
+    print(f"INFO: Enabling minimum site role for group: {group.name}")
+    group.minimum_site_role = 'Viewer'  # Adjust this to the desired role
+    server.groups.update(group)
+
+
+def switch_to_site(server, site):
+    '''Get a server signed in to the site, switching the current session where the deployment allows it'''
+    if server.site_id == site.id:
+        return server
+    if not IS_TABLEAU_CLOUD:
+        try:
+            # Reuse the session (and its open connections) instead of signing in again
+            server.auth.switch_site(site)
+            return server
+        except TSC.ServerResponseError as e:
+            print(f"WARNING: Could not switch to site '{site.content_url}', signing in again - {e}")
+    # Sign out first: the personal access token allows only one session at a time
+    tableau_signout(server)
+    return tableau_signin(site.content_url)
+
+
+def process_site(server, site):
+    '''Deactivate the inactive viewers of a site, returns the server signed in to the site'''
+    site_url = site.content_url
+    print(f"Processing site: {site_url}")
+    server = switch_to_site(server, site)
 
-if __name__ == "__main__":
-    print("--**--")
     try:
+        # Task 1: Get the candidate inactive viewers from the Tableau server
+        user_list = get_users(server)
+        print()
 
-        site_list = []
-        site_list = get_sites()
-        for site_list in site_list:
-            print(f"Processing site: {site_list}")
-            # Sign in to Tableau server
-            server = tableau_signin(site_list)
+        # TASK 2: Identify users with Site role = viewer whose last sign in > 500 days : Inactive users
+        inactive_users = get_inactive_users(user_list, site_url)
+        print()
 
-            try:
-                # Task 0: Disable minimum site role before processing users
-                disable_minimum_site_role(server)
+        # inactive_users = inactive_users[:1]
+
+        # Nothing to save or deactivate: leave the site (and its groups) untouched
+        if not inactive_users:
+            print(f"INFO: No inactive users on site '{site_url}'.")
+            return server
 
-                # Task 1: Get all the users from the Tableau server
-                user_list = get_users(server)
-                print()
+        # Task 0: Disable minimum site role before processing users
+        # The group is looked up once and reused to re-enable the role in TASK 6
+        all_users_group = get_all_users_group(server)
+        disable_minimum_site_role(server, all_users_group)
 
-                # TASK 2: Identify users with Site role = viewer
-                viewer_list = []
-                for user in user_list:
-                    if user.site_role == "Viewer":
-                        viewer_list.append(user)
-                print("INFO: Total number of users with Site role as Viewer: ", len(viewer_list))
-                print()
+        # TASK 4: save the inactive user info to a csv file (one file per site)
+        print("INFO: Saving the inactive user info to a csv file...")
+        save_info(inactive_users, f"users_info_{site_url or 'default'}.csv")
+        print()
 
-                # TASK 3: Identify viewers  whose last sign in > 700 days : Inactive users
-                inactive_users = get_inactive_users(viewer_list)
-                print()
+        # TASK 5: Deactivate the inactive users
+        deactivate_users(inactive_users, server, site_url)
+        print()
 
-                # inactive_users = inactive_users[:1]
+        # TASK 6:Re-enable minimum site role after processing users
+        enable_minimum_site_role(server, all_users_group)
+
+    except Exception as e:
+        print(f"ERROR: Failed to process site '{site_url}' - {e}")
+    return server
 
-                # TASK 4: save the inactive user info to a csv file
-                print("INFO: Saving the inactive user info to a csv file...")
-                save_info(inactive_users)
-                print()
 
-                # TASK 5: Deactivate the inactive users
-                deactivate_users(inactive_users)
-                print()
+if __name__ == "__main__":
+    # Log records go straight to stdout, in order with the print() output around them
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    logger.addHandler(stream_handler)
+    logger.setLevel(logging.INFO)
 
-                # TASK 6:Re-enable minimum site role after processing users
-                enable_minimum_site_role(server)
+    print("--**--")
+    server = None
+    try:
 
-            except Exception as e:
-                print(f"ERROR: Failed to process site '{site_list}' - {e}")
-            finally:
-                server.auth.sign_out()
-                print(f"INFO: Successfully signed out of Tableau server for site '{site_list}'.")
+        server = tableau_signin(config.HYPER_SITE_NAME)
+        sites = get_sites(server)
+        # The sites are processed one after the other with one session at a time: Tableau allows only one
+        # session per personal access token, signing in again ends the previous one (401 on its requests)
+        for site in sites:
+            server = process_site(server, site)
 
     except Exception as e:
         print("ERROR: ", e)
     finally:
+        if server is not None:
+            tableau_signout(server)
         print("--**--")